@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""Benchmark the Python tools on synthetic cuneiform corpora and check the results against a baseline."""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import itertools
+import subprocess
+import collections
+import tracemalloc
+
+from check_traineddata import levenshtein, wer
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class CorpusGenerator:
+    """Generate synthetic cuneiform text with the sign, word length and line length distributions of a real corpus."""
+    def __init__(self, unigram_freqs: str, wordlist: str, training_text: str, seed=0):
+        self.rng = random.Random(seed)
+        # Cumulative weights are computed once, choices() would otherwise accumulate them on every call
+        sign_counts = collections.Counter()
+        with open(unigram_freqs, 'r', encoding='utf-8') as f:
+            for line in f:
+                sign, count = line.split()
+                sign_counts[sign] += int(count)
+        self.signs, self.sign_cum_weights = self.distribution(sign_counts)
+        with open(wordlist, 'r', encoding='utf-8') as f:
+            self.word_lengths, self.word_length_cum_weights = self.distribution(
+                collections.Counter(len(word.rstrip()) for word in f))
+        with open(training_text, 'r', encoding='utf-8') as f:
+            self.line_lengths, self.line_length_cum_weights = self.distribution(
+                collections.Counter(len(line.split()) for line in f))
+
+    @staticmethod
+    def distribution(cnt: collections.Counter) -> tuple:
+        """Return values and their cumulative weights, leaving out empty values"""
+        items = [(value, count) for value, count in cnt.items() if value]
+        return [value for value, _ in items], list(itertools.accumulate(count for _, count in items))
+
+    def sign(self) -> str:
+        return self.rng.choices(self.signs, cum_weights=self.sign_cum_weights)[0]
+
+    def line(self) -> str:
+        nwords = self.rng.choices(self.line_lengths, cum_weights=self.line_length_cum_weights)[0]
+        lengths = self.rng.choices(self.word_lengths, cum_weights=self.word_length_cum_weights, k=nwords)
+        signs = iter(self.rng.choices(self.signs, cum_weights=self.sign_cum_weights, k=sum(lengths)))
+        return ' '.join(''.join(next(signs) for _ in range(length)) for length in lengths)
+
+    def write_corpus(self, filename: str, lines: int):
+        with open(filename, 'w', encoding='utf-8') as f:
+            for _ in range(lines):
+                f.write(self.line() + '\n')
+
+    def mutate(self, line: str, rate=0.05) -> str:
+        """Substitute random signs to create an OCR hypothesis"""
+        return ''.join(self.sign() if c != ' ' and self.rng.random() < rate else c for c in line)
+
+
+# Runs a tool in a fresh interpreter and writes its peak RSS (KiB) into the file given as first argument.
+# VmHWM belongs to the address space created by exec, whereas ru_maxrss also counts the RSS of the process
+# that spawned it, which would be the footprint of this benchmark harness.
+LAUNCHER = """import runpy, sys
+rssfile, sys.argv = sys.argv[1], sys.argv[2:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+    with open('/proc/self/status') as status, open(rssfile, 'w') as f:
+        f.write([line.split()[1] for line in status if line.startswith('VmHWM:')][0])
+"""
+
+
+def run_script(args: list, workdir: str) -> tuple:
+    """Run a tool as a subprocess, return wall time in seconds and peak RSS in KiB"""
+    rssfile = os.path.join(workdir, 'peak_rss.txt')
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', LAUNCHER, rssfile] + args, stdout=subprocess.DEVNULL, check=True)
+    elapsed = time.perf_counter() - start
+    with open(rssfile, 'r') as f:
+        return elapsed, int(f.read())
+
+
+def run_function(function, pairs: list) -> tuple:
+    """Apply a metric to all pairs in-process, return wall time in seconds and peak traced memory in KiB"""
+    # Time and memory are measured in separate passes, because tracemalloc slows down every allocation
+    start = time.perf_counter()
+    for ref, hyp in pairs:
+        function(ref, hyp)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    for ref, hyp in pairs:
+        function(ref, hyp)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak // 1024
+
+
+def benchmark_create_dictdata(corpus: str, workdir: str, language: str) -> tuple:
+    return run_script([os.path.join(TOOLS_DIR, 'create_dictdata.py'), '-l', language, '-i', corpus, '-d', workdir],
+                      workdir)
+
+
+def benchmark_rewrap(corpus: str, workdir: str, language: str) -> tuple:
+    return run_script([os.path.join(TOOLS_DIR, 'rewrap.py'), corpus, os.path.join(workdir, 'rewrapped.txt'), '40'],
+                      workdir)
+
+
+# Tools processing a whole corpus, run for every corpus size
+CORPUS_BENCHMARKS = {
+    'create_dictdata': benchmark_create_dictdata,
+    'rewrap': benchmark_rewrap,
+}
+
+# Metrics working on single reference/hypothesis pairs, run once on a fixed amount of pairs
+METRIC_BENCHMARKS = {
+    'levenshtein': levenshtein,
+    'wer': wer,
+}
+
+
+def measure(benchmark, repeats: int) -> dict:
+    """Repeat a benchmark, keep the best time and the worst peak memory"""
+    measurements = [benchmark() for _ in range(repeats)]
+    return {'time': min(measurement[0] for measurement in measurements),
+            'peak_memory_kib': max(measurement[1] for measurement in measurements)}
+
+
+def check_regressions(results: dict, baseline: dict, threshold: float) -> tuple:
+    """Compare results with the baseline, return descriptions of everything worse than the threshold
+    and of results the baseline has no entry for"""
+    regressions = []
+    missing = []
+    for tool, sizes in results.items():
+        for size, measurement in sizes.items():
+            reference = baseline.get(tool, {}).get(size)
+            if not reference:
+                missing.append('{} at {}'.format(tool, size))
+                continue
+            for key in ('time', 'peak_memory_kib'):
+                if reference[key] and measurement[key] > reference[key] * (1 + threshold):
+                    regressions.append('{} at {}: {} {} vs. baseline {}'.format(tool, size, key,
+                                                                               measurement[key], reference[key]))
+    return regressions, missing
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=sys.modules[__name__].__doc__,
+                                        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    argparser.add_argument('-l', '--language', default='akk', help='ISO-632-3 language code')
+    argparser.add_argument('-D', '--directory', default=os.path.join(TOOLS_DIR, '..', 'training'),
+                           help='Training directory with unigram frequencies, wordlist and training text')
+    argparser.add_argument('-s', '--sizes', type=lambda v: [int(size) for size in v.split(',')],
+                           default='10000,100000,1000000,10000000', help='Corpus sizes in lines (comma-separated)')
+    argparser.add_argument('-b', '--benchmarks', type=lambda v: v.split(','),
+                           default=','.join(list(CORPUS_BENCHMARKS) + list(METRIC_BENCHMARKS)),
+                           help='Benchmarks to run (comma-separated)')
+    argparser.add_argument('-m', '--pairs', type=int, default=10000,
+                           help='Amount of reference/hypothesis pairs for levenshtein and wer')
+    argparser.add_argument('-r', '--repeats', type=int, default=3, help='Repeats of each benchmark, best one counts')
+    argparser.add_argument('--seed', type=int, default=0, help='Random seed of the corpus generator')
+    argparser.add_argument('-c', '--compare', help='Baseline JSON file to check for regressions')
+    argparser.add_argument('-t', '--threshold', type=float, default=0.1, help='Allowed relative regression')
+    argparser.add_argument('-o', '--output', help='Store results as JSON baseline into this file')
+    args = argparser.parse_args()
+    unknown = set(args.benchmarks) - set(CORPUS_BENCHMARKS) - set(METRIC_BENCHMARKS)
+    if unknown:
+        argparser.error('unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO)
+
+    generator = CorpusGenerator(os.path.join(args.directory, '{}.training_text.unigram_freqs'.format(args.language)),
+                                os.path.join(args.directory, '{}.wordlist'.format(args.language)),
+                                os.path.join(args.directory, '{}.training_text'.format(args.language)),
+                                args.seed)
+    results = {tool: {} for tool in args.benchmarks}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            logging.info('Generating corpus with %d lines...', size)
+            corpus = os.path.join(workdir, 'corpus.txt')
+            generator.write_corpus(corpus, size)
+            for tool in CORPUS_BENCHMARKS:
+                if tool in args.benchmarks:
+                    logging.info('Benchmarking %s...', tool)
+                    results[tool]['{} lines'.format(size)] = measure(
+                        lambda: CORPUS_BENCHMARKS[tool](corpus, workdir, args.language), args.repeats)
+    pairs = [(ref, generator.mutate(ref)) for ref in (generator.line() for _ in range(args.pairs))]
+    for tool, function in METRIC_BENCHMARKS.items():
+        if tool in args.benchmarks:
+            logging.info('Benchmarking %s...', tool)
+            results[tool]['{} pairs'.format(args.pairs)] = measure(lambda: run_function(function, pairs), args.repeats)
+    for tool, sizes in results.items():
+        for size, measurement in sizes.items():
+            print('{} at {}: {:.3f} s, {} KiB'.format(tool, size, measurement['time'], measurement['peak_memory_kib']))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as outfile:
+            json.dump(results, outfile, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baselinefile:
+            regressions, missing = check_regressions(results, json.load(baselinefile), args.threshold)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        for result in missing:
+            print('NO BASELINE: ' + result)
+        if regressions or missing:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 """This utility checks the error rate of Tesseract OCR traineddata."""
 
+import io
 import os
+import math
 import sys
 import random
 import logging
@@ -9,8 +11,13 @@ import textwrap
 import argparse
 import subprocess
 import statistics
+import time
 from abc import ABCMeta, abstractmethod
 from datetime import datetime
+try:
+    from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+except ImportError:
+    Image = None
 
 
 def levenshtein(s: str, t: str) -> int:
@@ -78,6 +85,60 @@ def wer(ref: str, hyp: str) -> float:
     return d[len(r)][len(h)] / float(len(r))
 
 
+def cer(ref: str, hyp: str) -> float:
+    """Character error rate, based on the Levenshtein distance"""
+    return levenshtein(ref, hyp) / float(len(ref))
+
+
+def t_cdf(t: float, df: int) -> float:
+    """Cumulative distribution function of Student's t-distribution for integer degrees of freedom,
+    after Abramowitz and Stegun 26.7.3 and 26.7.4"""
+    theta = math.atan(t / math.sqrt(df))
+    sin, cos2 = math.sin(theta), math.cos(theta) ** 2
+    if df % 2 == 1:
+        term, series = 1.0, 1.0 if df > 1 else 0.0
+        for k in range(3, df - 1, 2):
+            term *= cos2 * (k - 1) / k
+            series += term
+        a = 2 / math.pi * (theta + sin * math.cos(theta) * series)
+    else:
+        term, series = 1.0, 1.0
+        for k in range(2, df - 1, 2):
+            term *= cos2 * (k - 1) / k
+            series += term
+        a = sin * series
+    return (1 + a) / 2
+
+
+def t_quantile(p: float, df: int) -> float:
+    """Quantile of Student's t-distribution; exact by bisection for small df, Cornish-Fisher expansion otherwise"""
+    z = statistics.NormalDist().inv_cdf(p)
+    if df >= 30:
+        return z + (z**3 + z) / (4 * df) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+    low, high = -1e6, 1e6
+    for _ in range(100):
+        middle = (low + high) / 2
+        if t_cdf(middle, df) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def t_interval(values: list, confidence: float) -> tuple:
+    """Confidence interval of the mean using Student's t-distribution"""
+    mean = statistics.mean(values)
+    half_width = t_quantile((1 + confidence) / 2, len(values) - 1) * statistics.stdev(values) / len(values) ** 0.5
+    return mean - half_width, mean + half_width
+
+
+def bootstrap_interval(values: list, confidence: float, resamples=1000) -> tuple:
+    """Percentile bootstrap confidence interval of the mean"""
+    means = sorted(math.fsum(random.choices(values, k=len(values))) / len(values) for _ in range(resamples))
+    alpha = (1 - confidence) / 2
+    return means[int(alpha * (resamples - 1))], means[int((1 - alpha) * (resamples - 1))]
+
+
 class AbstractReport(metaclass=ABCMeta):
     @abstractmethod
     def add_test(self, reference: str, hypothesis: str):
@@ -189,6 +250,142 @@ p.error {
 ''')
 
 
+class SequentialSampler:
+    """Track confidence intervals of WER and CER and decide when enough tests have been run."""
+    def __init__(self, method: str, half_width: float, confidence: float, min_tests: int, time_budget: float,
+                 every=10):
+        self.interval = t_interval if method == 't' else bootstrap_interval
+        self.every = every
+        self.half_width = half_width
+        self.confidence = confidence
+        self.min_tests = min_tests
+        self.time_budget = time_budget
+        self.start_time = time.monotonic()
+        self.wer_list = []
+        self.cer_list = []
+
+    def add_test(self, reference: str, hypothesis: str):
+        self.wer_list.append(wer(reference, hypothesis))
+        self.cer_list.append(cer(reference, hypothesis))
+
+    def intervals(self) -> tuple:
+        return self.interval(self.wer_list, self.confidence), self.interval(self.cer_list, self.confidence)
+
+    def should_stop(self) -> bool:
+        # Reports need at least two tests for the standard deviation
+        if len(self.wer_list) < 2:
+            return False
+        if self.time_budget and time.monotonic() - self.start_time >= self.time_budget:
+            logging.info('Time budget of %s seconds exhausted', self.time_budget)
+            return True
+        if not self.half_width or len(self.wer_list) < self.min_tests or len(self.wer_list) % self.every != 0:
+            return False
+        # Identical error rates on every test give a zero-width interval, which is no evidence of precision
+        if len(set(self.wer_list)) == 1 or len(set(self.cer_list)) == 1:
+            return False
+        return all((high - low) / 2 <= self.half_width for low, high in self.intervals())
+
+    def export_report(self):
+        print('Tests run: {}'.format(len(self.wer_list)))
+        if len(self.wer_list) < 2:
+            return
+        (wer_low, wer_high), (cer_low, cer_high) = self.intervals()
+        print('WER: mean {}, {:g}% CI [{}, {}]'.format(statistics.mean(self.wer_list), self.confidence * 100, wer_low, wer_high))
+        print('CER: mean {}, {:g}% CI [{}, {}]'.format(statistics.mean(self.cer_list), self.confidence * 100, cer_low, cer_high))
+
+
+class AbstractRenderer(metaclass=ABCMeta):
+    @abstractmethod
+    def render(self, outputbase: str, lines: list, font: str) -> bytes:
+        pass
+
+
+class Text2ImageRenderer(AbstractRenderer):
+    """Render test images with Tesseract's text2image utility, one subprocess per test."""
+    def __init__(self, text2image_cmd: str, exposure: int):
+        self.text2image_cmd = text2image_cmd
+        self.exposure = exposure
+
+    def render(self, outputbase: str, lines: list, font: str) -> bytes:
+        testfn = outputbase + '.txt'
+        imagefn = outputbase + '.tif'
+        boxfn = outputbase + '.box'
+        with open(testfn, 'w', encoding='utf-8') as testtext:
+            testtext.writelines([line + '\n' for line in lines])
+        subprocess.run([self.text2image_cmd,
+                        '--outputbase', outputbase,
+                        '--font', font,
+                        '--exposure', str(self.exposure),
+                        '--text', testfn])
+        with open(imagefn, 'rb') as imagefile:
+            image = imagefile.read()
+        os.remove(boxfn)
+        os.remove(testfn)
+        os.remove(imagefn)
+        return image
+
+
+class PillowRenderer(AbstractRenderer):
+    """Render test images in memory with Pillow; fonts are loaded only once."""
+    def __init__(self, fonts: list, dpi: int, ptsize: int, exposure: int, noise: float, margin=50):
+        self.dpi = dpi
+        self.exposure = exposure
+        self.noise = noise
+        self.margin = margin
+        size = round(ptsize * dpi / 72)
+        self.fonts = {font: ImageFont.truetype(self.find_font_file(font), size) for font in fonts}
+
+    @staticmethod
+    def find_font_file(font: str) -> str:
+        """Accept either a font file or a font name, which is resolved with fontconfig.
+        A trailing part of the name may be the style, like in text2image (e.g. 'CuneiformNAOutline Medium')."""
+        if os.path.isfile(font):
+            return font
+        words = font.split()
+        for split in range(len(words), 0, -1):
+            family, style = ' '.join(words[:split]), ' '.join(words[split:])
+            pattern = family + (':style=' + style if style else '')
+            matched = subprocess.run(['fc-match', '--format=%{family}\n%{style}\n%{fullname}\n%{file}', pattern],
+                                     stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.split('\n')
+            families, styles, fullnames, filename = [field.split(',') for field in matched[:3]] + [matched[3]]
+            # fc-match always returns some font, so make sure it is not a fallback
+            if (family.lower() in [name.lower() for name in families] and
+                    (not style or style.lower() in [name.lower() for name in styles])) or \
+                    font.lower() in [name.lower() for name in fullnames]:
+                return filename
+        raise ValueError('Font {} not found'.format(font))
+
+    def render(self, outputbase: str, lines: list, font: str) -> bytes:
+        imagefont = self.fonts[font]
+        ascent, descent = imagefont.getmetrics()
+        line_height = ascent + descent
+        width = max(int(imagefont.getlength(line)) for line in lines) + 2 * self.margin
+        height = line_height * len(lines) + 2 * self.margin
+        image = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        for line_index, line in enumerate(lines):
+            draw.text((self.margin, self.margin + line_index * line_height), line, font=imagefont, fill=0)
+        # Emulate exposure like text2image: positive values thicken the glyphs, negative ones thin them
+        for _ in range(abs(self.exposure)):
+            image = image.filter(ImageFilter.MinFilter(3) if self.exposure > 0 else ImageFilter.MaxFilter(3))
+        if self.noise:
+            image = ImageChops.add(image, Image.effect_noise(image.size, self.noise), offset=-128)
+        imagefile = io.BytesIO()
+        image.save(imagefile, format='PNG', dpi=(self.dpi, self.dpi))
+        return imagefile.getvalue()
+
+
+def ocr(tesseract_cmd: str, language: str, image: bytes, tessdata=None, check=False) -> str:
+    """Pass image to Tesseract through stdin and return recognised text as one line;
+    with check, raise CalledProcessError if Tesseract fails"""
+    tessdata_opts = ['--tessdata-dir', tessdata] if tessdata else []
+    result = subprocess.run([tesseract_cmd] + tessdata_opts +
+                            ['-l', language,
+                             'stdin', 'stdout'],
+                            input=image, stdout=subprocess.PIPE, check=check)
+    return ' '.join([line.rstrip() for line in result.stdout.decode('utf-8').splitlines()])
+
+
 def main():
     argparser = argparse.ArgumentParser(description=sys.modules[__name__].__doc__,
                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -197,12 +394,25 @@ def main():
     argparser.add_argument('-w', '--wrap', type=int, default=80, help='Specify max width of a text line')
     argparser.add_argument('-f', '--font', help='Font names (multiple names must be separated with comma')
     argparser.add_argument('-e', '--wpe', type=int, default=10, help='Words per example')
-    argparser.add_argument('-t', '--tests', type=int, default=1000, help='Amount of tests')
+    argparser.add_argument('-t', '--tests', type=int, default=1000, help='Amount of tests (maximum in adaptive mode)')
     argparser.add_argument('-x', '--exposure', type=int, default=0, help='Exposure of the test image')
+    argparser.add_argument('-n', '--renderer', choices=['text2image', 'pillow'], default='text2image',
+                           help='Test image renderer')
+    argparser.add_argument('--dpi', type=int, default=300, help='Resolution of the test image (pillow renderer)')
+    argparser.add_argument('--ptsize', type=int, default=12, help='Font size in points (pillow renderer)')
+    argparser.add_argument('--noise', type=float, default=0.0, help='Gaussian noise sigma (pillow renderer)')
     argparser.add_argument('-p', '--path', help='Tesseract path')
-    argparser.add_argument('-d', '--tessdata', help='Tessdata directory')
+    argparser.add_argument('-d', '--tessdata', help='Tessdata directory (its parent for Tesseract 3.x)')
     argparser.add_argument('-r', '--report', choices=['stat', 'html', 'htmlp'], default='stat', help='Type of report')
+    argparser.add_argument('--ci-width', type=float, help='Stop when CI half-width of WER and CER drops below this')
+    argparser.add_argument('--ci-method', choices=['t', 'bootstrap'], default='t', help='Confidence interval method')
+    argparser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the interval')
+    argparser.add_argument('--min-tests', type=int, default=30, help='Minimum amount of tests in adaptive mode')
+    argparser.add_argument('--ci-every', type=int, default=10, help='Recompute confidence intervals every N tests')
+    argparser.add_argument('--time-budget', type=float, help='Stop after this many seconds')
     args = argparser.parse_args()
+    if args.renderer == 'pillow' and Image is None:
+        argparser.error('pillow renderer requires Pillow to be installed')
 
     logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO)
 
@@ -217,34 +427,32 @@ def main():
         report = HTMLTableReport()
     elif args.report == 'htmlp':
         report = HTMLParagraphReport()
+    if args.renderer == 'text2image':
+        renderer = Text2ImageRenderer(text2image_cmd, args.exposure)
+    elif args.renderer == 'pillow':
+        renderer = PillowRenderer(fonts, args.dpi, args.ptsize, args.exposure, args.noise)
+    if args.ci_width or args.time_budget:
+        sampler = SequentialSampler(args.ci_method, args.ci_width, args.confidence, args.min_tests, args.time_budget,
+                                    args.ci_every)
+    else:
+        sampler = None
     for i in range(args.tests):
         test_ref = ' '.join(random.sample(wordlist, args.wpe))
         outputbase = 'test{:04}'.format(i)
-        testfn = outputbase + '.txt'
-        imagefn = outputbase + '.tif'
-        boxfn = outputbase + '.box'
-        logging.info('Creating test image file...')
-        with open(testfn, 'w', encoding='utf-8') as testtext:
-            testtext.writelines([line + '\n' for line in textwrap.wrap(test_ref, args.wrap)])
-        subprocess.run([text2image_cmd,
-                        '--outputbase', outputbase,
-                        '--font', random.choice(fonts),
-                        '--exposure', str(args.exposure),
-                        '--text', testfn])
-        os.remove(boxfn)
-        os.remove(testfn)
-        logging.info('OCRing test image file')
-        subprocess.run([tesseract_cmd,
-                        '-l', args.language,
-                        imagefn, outputbase])
-        with open(testfn, 'r', encoding='utf-8') as recognisedtext:
-            test_hyp = ' '.join([line.rstrip() for line in recognisedtext.readlines()])
-        os.remove(imagefn)
-        os.remove(testfn)
+        logging.info('Creating test image...')
+        image = renderer.render(outputbase, textwrap.wrap(test_ref, args.wrap), random.choice(fonts))
+        logging.info('OCRing test image')
+        test_hyp = ocr(tesseract_cmd, args.language, image, args.tessdata)
         # Add reference and hypothesis to report
         report.add_test(test_ref, test_hyp)
+        if sampler:
+            sampler.add_test(test_ref, test_hyp)
+            if sampler.should_stop():
+                break
     # Export results
     report.export_report()
+    if sampler:
+        sampler.export_report()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""This utility sweeps the dictionary size of Tesseract OCR traineddata and measures latency against accuracy."""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import textwrap
+import argparse
+import subprocess
+import statistics
+
+from check_traineddata import Image, Text2ImageRenderer, PillowRenderer, ocr, wer
+
+# Smallest image Tesseract will accept; OCRing it measures mostly the time spent loading traineddata
+BLANK_IMAGE = b'P1\n1 1\n0\n'
+
+
+def read_lines(filename: str) -> list:
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f]
+
+
+def write_lines(filename: str, lines: list):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.writelines([line + '\n' for line in lines])
+
+
+def parse_cutoffs(value: str) -> list:
+    """Parse comma-separated cutoffs, where 'all' (None) means the full list"""
+    cutoffs = [None if cutoff == 'all' else int(cutoff) for cutoff in value.split(',')]
+    if any(cutoff is not None and cutoff < 1 for cutoff in cutoffs):
+        raise argparse.ArgumentTypeError('cutoffs must be at least 1')
+    return cutoffs
+
+
+def cutoff_label(cutoff) -> str:
+    return 'all' if cutoff is None else str(cutoff)
+
+
+def build_variant(args: argparse.Namespace, cutoff, wordlist: list, bigrams: list, wordlist2dawg_cmd: str,
+                  combine_tessdata_cmd: str) -> str:
+    """Build dawgs from the top-ranked entries and combine them into a traineddata variant,
+    return the directory to pass to Tesseract's --tessdata-dir"""
+    variant_dir = os.path.join(args.output, 'top' + cutoff_label(cutoff))
+    tessdata_dir = os.path.join(variant_dir, 'tessdata')
+    os.makedirs(tessdata_dir, exist_ok=True)
+    unicharset = os.path.join(args.directory, '{}.unicharset'.format(args.language))
+    freq_size = args.freq_size if cutoff is None else min(cutoff, args.freq_size)
+    dawgs = {'word-dawg': wordlist[:cutoff], 'freq-dawg': wordlist[:freq_size], 'bigram-dawg': bigrams[:cutoff]}
+    dawg_files = []
+    for dawg, entries in dawgs.items():
+        listfn = os.path.join(variant_dir, '{}.{}.txt'.format(args.language, dawg))
+        dawgfn = os.path.join(variant_dir, '{}.{}'.format(args.language, dawg))
+        write_lines(listfn, entries)
+        subprocess.run([wordlist2dawg_cmd, listfn, dawgfn, unicharset], check=True)
+        dawg_files.append(dawgfn)
+    traineddata = os.path.join(tessdata_dir, '{}.traineddata'.format(args.language))
+    shutil.copy2(os.path.join(args.directory, '{}.traineddata'.format(args.language)), traineddata)
+    subprocess.run([combine_tessdata_cmd, '-o', traineddata] + dawg_files, check=True)
+    # Tesseract 3.x (as on the xenial box) appends tessdata/ to --tessdata-dir, Tesseract 4 and later do not
+    return variant_dir if args.tesseract_version < 4 else tessdata_dir
+
+
+def evaluate_variant(args: argparse.Namespace, tesseract_cmd: str, tessdata_dir: str, tests: list) -> dict:
+    # Tesseract failing to load the variant must not pass for empty hypotheses, so every run is checked
+    load_times = []
+    for _ in range(args.load_repeats):
+        start = time.perf_counter()
+        ocr(tesseract_cmd, args.language, BLANK_IMAGE, tessdata_dir, check=True)
+        load_times.append(time.perf_counter() - start)
+    load_time = statistics.median(load_times)
+    latencies = []
+    wer_list = []
+    for test_ref, image in tests:
+        start = time.perf_counter()
+        test_hyp = ocr(tesseract_cmd, args.language, image, tessdata_dir, check=True)
+        latencies.append(time.perf_counter() - start)
+        wer_list.append(wer(test_ref, test_hyp))
+    return {'load_time': load_time,
+            'latency': statistics.mean(latencies),
+            'latency_without_load': statistics.mean(latencies) - load_time,
+            'wer': statistics.mean(wer_list)}
+
+
+def plot_results(results: list, plotfn: str):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pyplot
+    except ImportError:
+        logging.warning('matplotlib is not installed, skipping plot')
+        return
+    sizes = [result['words'] for result in results]
+    figure, axes = pyplot.subplots(3, 1, sharex=True, figsize=(6, 9))
+    for ax, key, label in zip(axes,
+                              ['load_time', 'latency_without_load', 'wer'],
+                              ['Load time, s', 'OCR latency per image, s', 'WER']):
+        ax.plot(sizes, [result[key] for result in results], marker='o')
+        ax.set_ylabel(label)
+        ax.grid(True)
+    axes[-1].set_xscale('log')
+    axes[-1].set_xlabel('Words in word-dawg')
+    figure.tight_layout()
+    figure.savefig(plotfn)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=sys.modules[__name__].__doc__,
+                                        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    argparser.add_argument('-l', '--language', default='akk', help='ISO-632-3 language code')
+    argparser.add_argument('-D', '--directory', default='.',
+                           help='Training directory with wordlist, word bigrams, unicharset and traineddata')
+    argparser.add_argument('-k', '--cutoffs', type=parse_cutoffs, default='100,1000,5000,10000,all',
+                           help='Top-K cutoffs of the ranked wordlist and word bigrams (comma-separated)')
+    argparser.add_argument('-q', '--freq-size', type=int, default=100, help='Maximum size of the freq-dawg')
+    argparser.add_argument('-o', '--output', default='sweep', help='Output directory for variants and results')
+    argparser.add_argument('-i', '--wordlist', required=True, help='File with words to build tests from')
+    argparser.add_argument('-w', '--wrap', type=int, default=80, help='Specify max width of a text line')
+    argparser.add_argument('-f', '--font', required=True, help='Font names (multiple names must be separated with comma')
+    argparser.add_argument('-e', '--wpe', type=int, default=10, help='Words per example')
+    argparser.add_argument('-t', '--tests', type=int, default=200, help='Amount of tests')
+    argparser.add_argument('-x', '--exposure', type=int, default=0, help='Exposure of the test image')
+    argparser.add_argument('-n', '--renderer', choices=['text2image', 'pillow'], default='text2image',
+                           help='Test image renderer')
+    argparser.add_argument('--dpi', type=int, default=300, help='Resolution of the test image (pillow renderer)')
+    argparser.add_argument('--ptsize', type=int, default=12, help='Font size in points (pillow renderer)')
+    argparser.add_argument('--noise', type=float, default=0.0, help='Gaussian noise sigma (pillow renderer)')
+    argparser.add_argument('--seed', type=int, default=0, help='Random seed of the test set')
+    argparser.add_argument('--load-repeats', type=int, default=5, help='Repeats of the load time measurement')
+    argparser.add_argument('-p', '--path', help='Tesseract path')
+    argparser.add_argument('-V', '--tesseract-version', type=int, default=3,
+                           help='Major version of Tesseract, which decides the --tessdata-dir convention')
+    args = argparser.parse_args()
+    if args.renderer == 'pillow' and Image is None:
+        argparser.error('pillow renderer requires Pillow to be installed')
+
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s %(message)s', level=logging.INFO)
+
+    text2image_cmd = os.path.join(args.path, 'text2image') if args.path else 'text2image'
+    tesseract_cmd = os.path.join(args.path, 'tesseract') if args.path else 'tesseract'
+    wordlist2dawg_cmd = os.path.join(args.path, 'wordlist2dawg') if args.path else 'wordlist2dawg'
+    combine_tessdata_cmd = os.path.join(args.path, 'combine_tessdata') if args.path else 'combine_tessdata'
+    dict_wordlist = read_lines(os.path.join(args.directory, '{}.wordlist'.format(args.language)))
+    dict_bigrams = read_lines(os.path.join(args.directory, '{}.word.bigrams'.format(args.language)))
+    with open(args.wordlist, 'r', encoding='utf-8') as wl:
+        wordlist = [word.rstrip() for word in wl]
+    fonts = args.font.split(',')
+    if args.renderer == 'text2image':
+        renderer = Text2ImageRenderer(text2image_cmd, args.exposure)
+    elif args.renderer == 'pillow':
+        renderer = PillowRenderer(fonts, args.dpi, args.ptsize, args.exposure, args.noise)
+    # Render the test set once, so that every variant is evaluated on the same images
+    logging.info('Rendering %d test images...', args.tests)
+    rng = random.Random(args.seed)
+    tests = []
+    for i in range(args.tests):
+        test_ref = ' '.join(rng.sample(wordlist, args.wpe))
+        image = renderer.render('test{:04}'.format(i), textwrap.wrap(test_ref, args.wrap), rng.choice(fonts))
+        tests.append((test_ref, image))
+    results = []
+    for cutoff in args.cutoffs:
+        logging.info('Building and evaluating variant with top %s entries', cutoff_label(cutoff))
+        tessdata_dir = build_variant(args, cutoff, dict_wordlist, dict_bigrams, wordlist2dawg_cmd,
+                                     combine_tessdata_cmd)
+        result = {'cutoff': cutoff,
+                  'words': len(dict_wordlist[:cutoff]),
+                  'bigrams': len(dict_bigrams[:cutoff])}
+        result.update(evaluate_variant(args, tesseract_cmd, tessdata_dir, tests))
+        print('top {label}: {words} words, {bigrams} bigrams, load {load_time:.3f} s, '
+              'latency {latency_without_load:.3f} s/image, WER {wer}'.format(label=cutoff_label(cutoff), **result))
+        results.append(result)
+    with open(os.path.join(args.output, 'results.json'), 'w', encoding='utf-8') as resultsfile:
+        json.dump(results, resultsfile, indent=2)
+    plot_results(results, os.path.join(args.output, 'sweep.png'))
+
+
+if __name__ == '__main__':
+    main()